@@ -1,6 +1,6 @@
 from typing import Dict
 from collections import Counter, defaultdict
-from random import shuffle, choice, randint
+from random import randint
 import math
 import random as rand
 import numpy as np
@@ -9,10 +9,23 @@ from flowers import Bouquet, Flower, FlowerSizes, FlowerColors, FlowerTypes
 from suitors.base import BaseSuitor
 from utils import flatten_counter
 from constants import MAX_BOUQUET_SIZE
-from copy import deepcopy
+from array import array
 
 # color, type, size ratio in experiments
 CTS_RATIO = [6, 4, 3]
+# experiment type -> (axis of flower_info it varies, control group assignment holding the other two attributes)
+EXP_AXES = {'color': (0, 'fc_control'), 'type': (1, 'ft_control'), 'size': (2, 'fs_control')}
+# each of color, type and size contributes a third of the total score
+ATTRIBUTE_WEIGHT = 1.0 / 3.0
+# enum members in value order, used to build the flower cache below
+_COLORS = list(FlowerColors)
+_TYPES = list(FlowerTypes)
+_SIZES = list(FlowerSizes)
+# the 72 distinct flowers, keyed by (color, type, size) value, so hot paths reuse them instead of re-creating them
+_FLOWER_CACHE = {
+    (c, t, s): Flower(color=_COLORS[c], type=_TYPES[t], size=_SIZES[s])
+    for c in range(len(_COLORS)) for t in range(len(_TYPES)) for s in range(len(_SIZES))
+}
 
 
 class Suitor(BaseSuitor):
@@ -23,13 +36,17 @@ class Suitor(BaseSuitor):
         :param suitor_id: unique id of your suitor in range(num_suitors)
         """
         super().__init__(days, num_suitors, suitor_id, name='g4')
+        # our own stream, seeded from the OS: drawing from np.random here would shift the markets main.py samples for
+        # everyone else, and a fixed seed would give the suitor the same preferences in every game
+        self.rng = np.random.default_rng()
         self.total_turns = days
         self.remaining_turns = self.total_turns
         self.fc_turn_count = np.ceil(days * CTS_RATIO[0] / sum(CTS_RATIO))
         self.ft_turn_count = np.ceil(days * CTS_RATIO[1] / sum(CTS_RATIO))
         self.fs_turn_count = days - self.fc_turn_count - self.ft_turn_count
-        all_ids = np.arange(num_suitors)
-        self.recipient_ids = all_ids[all_ids != suitor_id]
+        # plain ints rather than a numpy array: they are only iterated and used as dict keys
+        self.recipient_ids = [rid for rid in range(num_suitors) if rid != suitor_id]
+        self._recipient_pos = {rid: k for k, rid in enumerate(self.recipient_ids)}  # id -> index in recipient_ids
         self.to_be_tested = self._generate_exp_groups_single()
         self.train_feedback = np.zeros((len(self.recipient_ids), 6, 4, 3))  # feedback score from other recipients
         self.last_bouquet = None  # bouquet we gave out from the last turn
@@ -40,16 +57,34 @@ class Suitor(BaseSuitor):
         calculatedPoint = math.ceil(slope * (round_approx - 3*6) + fix1y)
         bouquets_to_generate = max(calculatedPoint, 30)
         self.best_arrangement = [self.generate_random_bouquet() for _ in range(bouquets_to_generate)]
+        # the first arrangement matches itself exactly, so it is the bouquet we score as 1
+        self.best_bouquet = Bouquet(dict(Counter(self.best_arrangement[0])))
         self.sizev, self.colorv, self.typev = [], [], []
         for arrangement in self.best_arrangement:
             s,c,v = self.get_bouquet_score_vectors(arrangement)
             self.sizev.append(s)
             self.colorv.append(c)
             self.typev.append(v)
+        # one row per arrangement, so a bouquet is scored against all of them in a single pass
+        self.sizev = np.asarray(self.sizev, dtype=np.float64)
+        self.colorv = np.asarray(self.colorv, dtype=np.float64)
+        self.typev = np.asarray(self.typev, dtype=np.float64)
+        self.best_arrangement_size_vec = self.sizev[0]
+        self.best_arrangement_color_vec = self.colorv[0]
+        self.best_arrangement_type_vec = self.typev[0]
+        self._threshold_by_len = {
+            n: self._compute_threshold(n) for n in (len(FlowerSizes), len(FlowerTypes), len(FlowerColors))
+        }
+        # past experiments per recipient, stored as parallel columns: bouquet given, its score and rank, and the
+        # experiment type ('color', 'type', 'size' or 'None' for random bouquets). 'counts' keeps a running number
+        # of experiments per type and 'seen' the string form of every bouquet given, for duplicate checks
         self.experiments = {}
         for i in range(num_suitors):
             if i != suitor_id:
-                self.experiments[i] = defaultdict(list)
+                self.experiments[i] = {
+                    'bouquets': [], 'scores': array('d'), 'ranks': array('l'), 'etype': [],
+                    'counts': {'color': 0, 'type': 0, 'size': 0, 'None': 0}, 'seen': set(),
+                }
         self.suitor_id = suitor_id  # Added this line
         self.num_suitors = num_suitors
         # throw in a testing round after 9 training rounds
@@ -60,15 +95,11 @@ class Suitor(BaseSuitor):
     def _get_combinations(list1, list2):
         return [[list1[i], list2[j]] for i in range(len(list1)) for j in range(len(list2))]
 
-    def generate_random_flower(self):
-        return Flower(
-            size=choice(list(FlowerSizes)),
-            color=choice(list(FlowerColors)),
-            type=choice(list(FlowerTypes)),
-        )
-
     def generate_random_bouquet(self):
-        return [self.generate_random_flower() for _ in range(randint(4, MAX_BOUQUET_SIZE+1))]
+        # draw every flower's attributes in one bulk call rather than three calls per flower
+        n = randint(4, MAX_BOUQUET_SIZE+1)
+        cs, ts, ss = self.rng.integers(0, [len(FlowerColors), len(FlowerTypes), len(FlowerSizes)], size=(n, 3)).T
+        return [_FLOWER_CACHE[(c, t, s)] for c, t, s in zip(cs, ts, ss)]
 
     def get_bouquet_score_vectors(self, bouquet_vect):
         size_vec = [0] * len(FlowerSizes)
@@ -81,47 +112,52 @@ class Suitor(BaseSuitor):
 
         return size_vec, color_vec, type_vec
 
-    def compute_cosine_sim(self, v1, v2):
-        # v1 and v2 are all positive numbers, so bounded from 0 to 1 
-        return (v1 @ v2.T) / (np.linalg.norm(v1) * np.linalg.norm(v2))
+    def compute_amp_dist(self, v1, v2):
+        # squared 4-norm distance; can make higher norm to increase steepness?
+        # v2 may be a matrix of arrangement vectors, in which case one distance per row is returned
+        diff = v1 - v2
+        diff = diff * diff
+        return np.sqrt((diff * diff).sum(axis=-1))
 
-    def compute_euc_dist(self, v1, v2):
-        # can make higher norm to increase steepness?
-        return np.linalg.norm(np.array(v1) - np.array(v2), ord = 4)
-
-    def compute_distance_heuristic(self, v1, v2):
-        # v1 and v2 bounded from 0 to inf
+    @staticmethod
+    def _compute_threshold(n):
         # need a cutoff to guarantee 0 score is possible. (e.g, assume we add distances together)
         # worst case scenario, theoretically the 
         # smallest maximum distance is assume the optimal bq is 12 flowers distributed amongst all attributes:
         # e.g, [4,4,4], [6,6], [3,3,3,3]
         # then according to our scoring heuristic, the 12 - min(vector) has to result in 0 (otherwise, it is possible
         # that no bq can result in a zero score.
-        most_even_dist = math.floor(12 / len(v1))
-        threshold_vect = [0] * len(v1)
+        most_even_dist = math.floor(12 / n)
+        threshold_vect = [0] * n
         threshold_vect[0] = 12
-        THRESHOLD = 1 / (
+        return 1 / (
             np.linalg.norm(
                 np.array(threshold_vect)-
-                np.array([most_even_dist] * len(v1))
+                np.array([most_even_dist] * n)
             ) + 1
-        ) 
-        amp_dist = self.compute_euc_dist(v1,v2)
-        amp_dist = amp_dist ** 2
+        )
+
+    def compute_distance_heuristic(self, v1, v2):
+        # v1 and v2 bounded from 0 to inf
+        # when v2 holds several arrangements, the best match is scored; thresholding the max once is the same as
+        # thresholding every arrangement and then taking the max
+        THRESHOLD = self._threshold_by_len[len(v1)]
+        amp_dist = self.compute_amp_dist(v1,v2)
         dist =  1 / (amp_dist + 1)
         dist = ((2*dist - 1) ** 3 + 1) / 2
+        dist = dist.max()
         return dist if dist > THRESHOLD else 0
 
     def _assign_control_groups(self):
         """
         Get control group assignments for all recipients.
         :return: assignments[i]['color_control'] = [t, s] a combination of type=t and size=s as the color controlled
-                 experiments setup for recipient i.
+                 experiments setup for recipient i. t and s are enum values, so they index flower_info directly.
         """
         # get combinations
-        fc_exp_options = [FlowerColors(i) for i in range(6)]
-        ft_exp_options = [FlowerTypes(i) for i in range(4)]
-        fs_exp_options = [FlowerSizes(i) for i in range(3)]
+        fc_exp_options = list(range(len(FlowerColors)))
+        ft_exp_options = list(range(len(FlowerTypes)))
+        fs_exp_options = list(range(len(FlowerSizes)))
         fc_control_options = self._get_combinations(ft_exp_options, fs_exp_options)
         ft_control_options = self._get_combinations(fc_exp_options, fs_exp_options)
         fs_control_options = self._get_combinations(fc_exp_options, ft_exp_options)
@@ -172,21 +208,18 @@ class Suitor(BaseSuitor):
         else:  # for testing rounds, need to pick best_rank among ranks across different turns
             for id in self.recipient_ids:
                 best_rank = self.num_suitors
-                categories = self.experiments[id].values()
-                for r in categories:
-                    for res in r:
-                        score, rank = res[1], res[2] # rank
-                        if score > 0:
-                            best_rank = min(best_rank, rank)
+                scores = np.asarray(self.experiments[id]['scores'])
+                past_ranks = np.asarray(self.experiments[id]['ranks'])[scores > 0]
+                if past_ranks.size:
+                    best_rank = min(best_rank, int(past_ranks.min()))
                 ranks.append((id, best_rank))
         
         ranks.sort(key=lambda x:x[1]) # sort by suitor ID in best order
-        num_flowers_remaining = 0
         idx = 0
         results = []
-        for key, value in flower_counts.items():
-            num_flowers_remaining += value
-        flower_counts = deepcopy(flower_counts)
+        # do the flower accounting on the (color, type, size) table rather than on a copy of the dict
+        flower_info = self._tabularize_flowers(flower_counts)
+        num_flowers_remaining = int(flower_info.sum())
         while num_flowers_remaining > 0 and idx < len(ranks):
             # Get this player's ideal bouqet size and statistics on flower choices
             player = ranks[idx][0]
@@ -194,16 +227,15 @@ class Suitor(BaseSuitor):
             idx += 1
             d = {}
             if bouquet_size > num_flowers_remaining:
-                for key, value in flower_counts:
-                    if value > 0:
-                        d[key] = value
+                d = self._list_flowers(flower_info)
             else:
                 # This scenario calculate which flowers are the best
-                li = self.calculate_flower_scores(flower_counts, color_rank, size_rank, type_rank)
+                li = self.calculate_flower_scores(flower_info, color_rank, size_rank, type_rank, limit=bouquet_size)
                 for i in range(bouquet_size):
                     f = li[i][0]
                     d[f] = d.get(f, 0) + 1
-                    flower_counts[f] -= 1
+                for f, count in d.items():
+                    flower_info[f.color.value, f.type.value, f.size.value] -= count
             
             # :return: list of tuples of (self.suitor_id, recipient_id, chosen_bouquet)
             num_flowers_remaining -= bouquet_size
@@ -215,14 +247,34 @@ class Suitor(BaseSuitor):
         
         return results
 
-    def calculate_flower_scores(self, flower_counts, color_rank, size_rank, type_rank):
+    def calculate_flower_scores(self, flower_info, color_rank, size_rank, type_rank, limit=None):
+        """
+        :param flower_info: available flower counts as a (color, type, size) table, see _tabularize_flowers
+        :return: list of (flower, score) with one entry per available flower, best first. When limit is given, only
+                 the first limit entries are guaranteed to be present.
+        """
+        # score every (color, type, size) cell at once, then walk the cells from best to worst
+        c_score = np.array([color_rank[fc] for fc in FlowerColors])
+        t_score = np.array([type_rank[ft] for ft in FlowerTypes])
+        s_score = np.array([size_rank[fs] for fs in FlowerSizes])
+        scores = c_score[:, None, None] + t_score[None, :, None] + s_score[None, None, :]
+        scores = np.where(flower_info > 0, scores, -np.inf)
+
+        # usually the single best cell has enough flowers, so try an argmax before sorting every cell
+        if limit is not None:
+            best = np.unravel_index(np.argmax(scores), scores.shape)
+            if flower_info[best] >= limit:
+                return [(_FLOWER_CACHE[best], scores[best])] * limit
+
+        order = np.argsort(-scores, axis=None, kind='stable')
+        cs, ts, ss = np.unravel_index(order, flower_info.shape)
+
         li = []
-        for key, value in flower_counts.items():
-            if value > 0:
-                score = size_rank[key.size] + color_rank[key.color] + type_rank[key.type]
-                for i in range(value):
-                    li.append((key, score))
-        li.sort(key=lambda x: x[1], reverse=True)
+        for c, t, s in zip(cs, ts, ss):
+            count = flower_info[c, t, s]
+            if count > 0:
+                flower = _FLOWER_CACHE[(c, t, s)]
+                li.extend([(flower, scores[c, t, s])] * int(count))
         return li
     
     def player_stats(self, player):
@@ -231,38 +283,20 @@ class Suitor(BaseSuitor):
         preferences_c = defaultdict(list)
         preferences_s = defaultdict(list)
         preferences_t = defaultdict(list)
-        categories = ['color', 'type', 'size']
-        # Loop through the colors
-        for experiment in results['color']:
-            bouquet, score = experiment[0], experiment[1]
-            counts[len(bouquet)].append(score)
-            # Colors that were in this bouquet -- no proportion being used just yet
-            for key in bouquet.colors:
-                preferences_c[key].append(score)
-
-        for experiment in results['type']:
-            bouquet, score = experiment[0], experiment[1]
-            counts[len(bouquet)].append(score)
-            # Colors that were in this bouquet -- no proportion being used just yet
-            for key in bouquet.types:
-                preferences_t[key].append(score)
-
-        for experiment in results['size']:
-            bouquet, score = experiment[0], experiment[1]
-            counts[len(bouquet)].append(score)
-            # Colors that were in this bouquet -- no proportion being used just yet
-            for key in bouquet.sizes:
-                preferences_s[key].append(score)
-
-        # Calculate the best bouquet size
-        bouquet_size = -1
-        bouquet_size_score = -1
-        for key, value in counts.items():
-            s = sum(value)
-            res = s / len(value)
-            if res > bouquet_size_score:
-                bouquet_size_score = res
-                bouquet_size = key
+        # one pass per experiment type, color then type then size, so bouquet sizes enter counts in that order and
+        # ties in the best size below keep resolving the same way; random bouquets are not controlled experiments
+        for category, attribute, preferences in (('color', 'colors', preferences_c), ('type', 'types', preferences_t),
+                                                 ('size', 'sizes', preferences_s)):
+            for bouquet, score, exp_type in zip(results['bouquets'], results['scores'], results['etype']):
+                if exp_type != category:
+                    continue
+                counts[len(bouquet)].append(score)
+                # Attributes that were in this bouquet -- no proportion being used just yet
+                for key in getattr(bouquet, attribute):
+                    preferences[key].append(score)
+
+        # Calculate the best bouquet size: the size with the highest average score
+        bouquet_size = max(counts.items(), key=lambda kv: sum(kv[1]) / len(kv[1]), default=(-1, None))[0]
 
 
         # Calculate proportion scores
@@ -406,13 +440,16 @@ class Suitor(BaseSuitor):
                     testing_ranks.append((recipient_id, results[recipient_id][0]))
                 testing_ranks.sort(key=lambda x: x[1])
                 self.recipient_ids = [testing_ranks[0] for testing_ranks in testing_ranks]
+                self._recipient_pos = {rid: k for k, rid in enumerate(self.recipient_ids)}
 
+            # the first rounds have no history to repeat, so skip the duplicate checks for every recipient
+            check_duplicates = self.days - self.remaining_turns > 1
             for ind in range(len(self.recipient_ids)):
                 recipient_id = self.recipient_ids[ind]
-                chosen_flowers, exp_type, flower_info = self._prepare_bouquet(flower_info, recipient_id)
+                chosen_flower_counts, exp_type, flower_info = self._prepare_bouquet(flower_info, recipient_id,
+                                                                                    check_duplicates)
 
                 # build the bouquet
-                chosen_flower_counts = dict(Counter(np.asarray(chosen_flowers)))
                 chosen_bouquet = Bouquet(chosen_flower_counts)
                 bouquet_for_all.append([self.suitor_id, recipient_id, chosen_bouquet])
                 bouquet_for_all_and_etype.append([self.suitor_id, recipient_id, chosen_bouquet, exp_type])
@@ -422,13 +459,12 @@ class Suitor(BaseSuitor):
 
             return bouquet_for_all
 
-    def _prepare_bouquet(self, flower_info, recipient_id):
-        chosen_flowers = []  # for building a bouquet later
-
+    def _prepare_bouquet(self, flower_info, recipient_id, check_duplicates=True):
         # generate the experiment order for this recipient for this turn
-        fc_todo_count = self.fc_turn_count - len(self.experiments[recipient_id]['color'])
-        ft_todo_count = self.ft_turn_count - len(self.experiments[recipient_id]['type'])
-        fs_todo_count = self.fs_turn_count - len(self.experiments[recipient_id]['size'])
+        past_exp_counts = self.experiments[recipient_id]['counts']
+        fc_todo_count = self.fc_turn_count - past_exp_counts['color']
+        ft_todo_count = self.ft_turn_count - past_exp_counts['type']
+        fs_todo_count = self.fs_turn_count - past_exp_counts['size']
         exp_todo_count = [fc_todo_count, ft_todo_count, fs_todo_count]
         exp_todo = ['color', 'type', 'size']
         exp_ind = np.argsort(exp_todo_count)[::-1]
@@ -436,191 +472,106 @@ class Suitor(BaseSuitor):
         exp_todo.append('None')
 
         # try out all exp types, if needed, in the order of exp_todo
-        for each_exp_todo in exp_todo:
-            exp_type = each_exp_todo
-
-            if exp_type == 'color':  # flower color
-
-                # get the fixed [size, type] setting for this recipient for the color experiments
-                fc_control = self.control_group_assignments[recipient_id]['fc_control']
-                fixed_ft = fc_control[0].value
-                fixed_fs = fc_control[1].value
-
-                # grab flower counts that match with fc_control for this round: list of length 6
-                fc_exp_options = flower_info[:, fixed_ft, fixed_fs]
-                if sum(fc_exp_options) > 0:  # if there are flowers to work with
-
-                    is_duplicate = True
-                    repeat_tolerance = 5
-                    while is_duplicate and repeat_tolerance:
-                        repeat_tolerance -= 1
-
-                        # randomly generate a flower count for each color from the available flowers
-                        fc_exp = [rand.choice(list(range(fc_exp_options[i] + 1))) for i in range(len(fc_exp_options))]
-
-                        chosen_flowers = []
-                        for fc_ind in range(len(fc_exp)):  # iterate over all colors
-                            for _ in range(fc_exp[fc_ind]):  # append flower(s) with color=fc_ind
-                                chosen_flowers.append(Flower(color=FlowerColors(fc_ind),
-                                                             type=FlowerTypes(fixed_ft),
-                                                             size=FlowerSizes(fixed_fs)))
-
-                        if self.days - self.remaining_turns <= 1:
-                            is_duplicate = False
-                        else:
-                            is_duplicate = self._is_duplicate(chosen_flowers, recipient_id)
-
-                        if not is_duplicate:
-                            for fc_ind in range(len(fc_exp)):  # iterate over all colors
-                                flower_info[fc_ind, fixed_ft, fixed_fs] -= fc_exp[fc_ind]  # decrement flower_info
+        for exp_type in exp_todo:
+            if exp_type == 'None':  # random
+                chosen_flower_counts, flower_info = self._generate_rand_bouquet(flower_info, recipient_id,
+                                                                                check_duplicates)
+            else:
+                chosen_flower_counts = self._run_experiment(flower_info, recipient_id, exp_type, check_duplicates)
+                if chosen_flower_counts is None:
+                    continue
 
-                    if is_duplicate:
-                        continue
+            return chosen_flower_counts, exp_type, flower_info
 
-                else:  # if there are no flower with the fc_control [size, type] setting
-                    continue
+    def _run_experiment(self, flower_info, recipient_id, exp_type, check_duplicates=True):
+        """
+        Vary one attribute ('color', 'type' or 'size') while the other two stay fixed at this recipient's control
+        setting, and take the chosen flowers out of flower_info.
+        :return: dictionary of the chosen flowers and their counts, or None if there are no flowers with the control
+                 setting or every attempt repeated a past bouquet
+        """
+        axis, control_key = EXP_AXES[exp_type]
+        fixed = list(self.control_group_assignments[recipient_id][control_key])
 
-            # flower type: second C_T_S_SPLIT proportion of the game
-            elif exp_type == 'type':
-                ft_control = self.control_group_assignments[recipient_id]['ft_control']
-                fixed_fc = ft_control[0].value
-                fixed_fs = ft_control[1].value
-                ft_exp_options = flower_info[fixed_fc, :, fixed_fs]
-                if sum(ft_exp_options) > 0:
-
-                    is_duplicate = True
-                    repeat_tolerance = 5
-                    while is_duplicate and repeat_tolerance:
-                        repeat_tolerance -= 1
-
-                        # randomly generate a flower count for each color from the available flowers
-                        ft_exp = [rand.choice(list(range(ft_exp_options[i] + 1))) for i in range(len(ft_exp_options))]
-
-                        chosen_flowers = []
-                        for ft_ind in range(len(ft_exp)):
-                            for _ in range(ft_exp[ft_ind]):
-                                chosen_flowers.append(Flower(color=FlowerColors(fixed_fc),
-                                                             type=FlowerTypes(ft_ind),
-                                                             size=FlowerSizes(fixed_fs)))
-
-                        if self.days - self.remaining_turns <= 1:
-                            is_duplicate = False
-                        else:
-                            is_duplicate = self._is_duplicate(chosen_flowers, recipient_id)
-
-                        if not is_duplicate:
-                            for ft_ind in range(len(ft_exp)):
-                                flower_info[fixed_fc, ft_ind, fixed_fs] -= ft_exp[ft_ind]
-
-                    if is_duplicate:
-                        continue
-
-                else:
-                    continue
+        # grab flower counts that match with the control setting for this round, e.g. flower_info[:, t, s] for
+        # color experiments. Basic indexing returns a view, so decrementing it updates flower_info
+        exp_options = flower_info[tuple(fixed[:axis] + [slice(None)] + fixed[axis:])]
+        if not exp_options.any():  # if there are no flowers to work with
+            return None
 
-            # flower size: third C_T_S_SPLIT proportion of the game
-            elif exp_type == 'size':
-                fs_control = self.control_group_assignments[recipient_id]['fs_control']
-                fixed_fc = fs_control[0].value
-                fixed_ft = fs_control[1].value
-                fs_exp_options = flower_info[fixed_fc, fixed_ft, :]
-                if sum(fs_exp_options) > 0:
-
-                    is_duplicate = True
-                    repeat_tolerance = 5
-                    while is_duplicate and repeat_tolerance:
-                        repeat_tolerance -= 1
-
-                        # randomly generate a flower count for each color from the available flowers
-                        fs_exp = [rand.choice(list(range(fs_exp_options[i] + 1))) for i in range(len(fs_exp_options))]
-
-                        chosen_flowers = []
-                        for fs_ind in range(len(fs_exp)):
-                            for _ in range(fs_exp[fs_ind]):
-                                chosen_flowers.append(Flower(color=FlowerColors(fixed_fc),
-                                                             type=FlowerTypes(fixed_ft),
-                                                             size=FlowerSizes(fs_ind)))
-
-                        if self.days - self.remaining_turns <= 1:
-                            is_duplicate = False
-                        else:
-                            is_duplicate = self._is_duplicate(chosen_flowers, recipient_id)
-
-                        if not is_duplicate:
-                            for fs_ind in range(len(fs_exp)):
-                                flower_info[fixed_fc, fixed_ft, fs_ind] -= fs_exp[fs_ind]
-
-                    if is_duplicate:
-                        continue
-
-                else:
-                    continue
+        # the candidate flowers only depend on the control setting, so look them up once
+        exp_flowers = [_FLOWER_CACHE[tuple(fixed[:axis] + [ind] + fixed[axis:])] for ind in range(len(exp_options))]
 
-            # random
-            else:
-                chosen_flowers, flower_info = self._generate_rand_bouquet(flower_info, recipient_id)
+        repeat_tolerance = 5
+        while repeat_tolerance:
+            repeat_tolerance -= 1
 
-            return chosen_flowers, exp_type, flower_info
+            # randomly generate a flower count for each value of the attribute from the available flowers
+            exp = self.rng.integers(0, exp_options + 1, dtype=np.int16)
+            chosen_flower_counts = {exp_flowers[ind]: k for ind, k in enumerate(exp.tolist()) if k}
 
-    def _is_duplicate(self, flower_exp, recipient_id):
-        for exp_type in ['color', 'type', 'size', 'None']:
-            if len(np.asarray(self.experiments[recipient_id][exp_type])) == 0:
-                continue
-            past_bouquets = np.asarray(self.experiments[recipient_id][exp_type])[:, 0]  # OrderedDict
+            if not (check_duplicates and self._is_duplicate(chosen_flower_counts, recipient_id)):
+                exp_options -= exp  # decrement flower_info
+                return chosen_flower_counts
 
-            # convert flower_exp into a OrderedDict
-            flower_exp_counts = dict(Counter(flower_exp))
-            flower_exp_arrangement = Bouquet(flower_exp_counts).arrangement
+        return None
 
-            # check all past bouquets
-            for past_bouquet in past_bouquets:
-                if past_bouquet.arrangement == flower_exp_arrangement:
-                    return True
-        return False
+    def _is_duplicate(self, flower_exp_counts, recipient_id):
+        # Bouquet sorts its arrangement, so equal arrangements have equal string representations; check against all
+        # past bouquets, whatever their experiment type
+        return str(Bouquet(flower_exp_counts)) in self.experiments[recipient_id]['seen']
 
     def _play_random_suitor(self, flower_counts):
-        all_ids = np.arange(self.num_suitors)
-        recipient_ids = all_ids[all_ids != self.suitor_id]
         remaining_flowers = flower_counts.copy()
-        return list(map(lambda recipient_id: self._play_random_suitor_helper(remaining_flowers, recipient_id), recipient_ids))
-
-    def _play_random_suitor_helper(self, remaining_flowers, recipient_id):
+        # count the flowers once; each bouquet then just subtracts its own size
         num_remaining = sum(remaining_flowers.values())
-        size = int(np.random.randint(0, min(MAX_BOUQUET_SIZE, num_remaining) + 1))
+        bouquets = []
+        for recipient_id in self.recipient_ids:
+            offer, size = self._play_random_suitor_helper(remaining_flowers, num_remaining, recipient_id)
+            num_remaining -= size
+            bouquets.append(offer)
+        return bouquets
+
+    def _play_random_suitor_helper(self, remaining_flowers, num_remaining, recipient_id):
+        size = randint(0, min(MAX_BOUQUET_SIZE, num_remaining))
         if size > 0:
-            chosen_flowers = np.random.choice(flatten_counter(remaining_flowers), size=(size,), replace=False)
-            chosen_flower_counts = dict(Counter(chosen_flowers))
+            # draw per-flower counts directly instead of sampling from the expanded flower list
+            flowers = list(remaining_flowers)
+            counts = np.fromiter(remaining_flowers.values(), dtype=np.int64, count=len(flowers))
+            draws = self.rng.multivariate_hypergeometric(counts, size)
+            chosen_flower_counts = {flowers[i]: int(c) for i, c in enumerate(draws) if c > 0}
+            # the hypergeometric draw never takes more of a flower than remains
             for k, v in chosen_flower_counts.items():
                 remaining_flowers[k] -= v
-                assert remaining_flowers[k] >= 0
         else:
             chosen_flower_counts = dict()
         chosen_bouquet = Bouquet(chosen_flower_counts)
-        return self.suitor_id, recipient_id, chosen_bouquet
+        return (self.suitor_id, recipient_id, chosen_bouquet), size
 
-    def _generate_rand_bouquet(self, flower_info, recipient_id):
+    def _generate_rand_bouquet(self, flower_info, recipient_id, check_duplicates=True):
         remaining_flowers = self._list_flowers(flower_info)
         num_remaining = sum(remaining_flowers.values())
 
         is_duplicate = True
         repeat_tolerance = 10
         while is_duplicate and repeat_tolerance:
-            size = int(np.random.randint(0, min(MAX_BOUQUET_SIZE, num_remaining) + 1))
+            size = randint(0, min(MAX_BOUQUET_SIZE, num_remaining))
             repeat_tolerance -= 1
-            chosen_flowers = np.random.choice(flatten_counter(remaining_flowers), size=(size,), replace=False)
+            chosen_flowers = self.rng.choice(flatten_counter(remaining_flowers), size=(size,), replace=False)
+            chosen_flower_counts = dict(Counter(chosen_flowers))
 
-            if self.days - self.remaining_turns <= 1:
-                is_duplicate = False
-            else:
-                is_duplicate = self._is_duplicate(chosen_flowers, recipient_id)
+            is_duplicate = check_duplicates and self._is_duplicate(chosen_flower_counts, recipient_id)
 
             if not is_duplicate:
-                for chosen_flower in chosen_flowers:
-                    flower_info[chosen_flower.color.value, chosen_flower.type.value, chosen_flower.size.value] -= 1
-                return chosen_flowers, flower_info
+                # a flower may be drawn more than once, so use an unbuffered subtract for the scatter
+                cs = np.fromiter((f.color.value for f in chosen_flowers), dtype=np.intp, count=len(chosen_flowers))
+                ts = np.fromiter((f.type.value for f in chosen_flowers), dtype=np.intp, count=len(chosen_flowers))
+                ss = np.fromiter((f.size.value for f in chosen_flowers), dtype=np.intp, count=len(chosen_flowers))
+                np.subtract.at(flower_info, (cs, ts, ss), 1)
+                return chosen_flower_counts, flower_info
 
-        chosen_flowers = []
-        return chosen_flowers, flower_info
+        chosen_flower_counts = {}
+        return chosen_flower_counts, flower_info
 
     # Helper function that adds to results
     # Make sure that last_bouquet is in the correct player order (i.e. suitor 0 is index 0)
@@ -630,110 +581,103 @@ class Suitor(BaseSuitor):
             if i != self.suitor_id:
                 player = self.experiments[i]
 
-                bouquet_given, exp_type = self.last_bouquet[list(self.recipient_ids).index(i)][2], \
-                                          self.last_bouquet[list(self.recipient_ids).index(i)][3]
+                idx = self._recipient_pos[i]
+                bouquet_given, exp_type = self.last_bouquet[idx][2], self.last_bouquet[idx][3]
 
-                # player[exp_type].append([bouquet_given, results[i][0], results[i][1]]) # TODO add rank to self.experiments
-                player[exp_type].append([bouquet_given, results[i][1], results[i][0]])
+                player['bouquets'].append(bouquet_given)
+                player['scores'].append(results[i][1])
+                player['ranks'].append(results[i][0])
+                player['etype'].append(exp_type)
+                player['counts'][exp_type] += 1
+                player['seen'].add(str(bouquet_given))
 
     @staticmethod
     def _tabularize_flowers(flower_counts):
-        flowers = flower_counts.keys()
-        flower_info = np.zeros((6, 4, 3), dtype=int)  # (color, type, size)
-        for flower in flowers:
-            flower_info[flower.color.value][flower.type.value][flower.size.value] = flower_counts[flower]
+        flowers = list(flower_counts)
+        n = len(flowers)
+        c = np.fromiter((flower.color.value for flower in flowers), dtype=np.intp, count=n)
+        t = np.fromiter((flower.type.value for flower in flowers), dtype=np.intp, count=n)
+        s = np.fromiter((flower.size.value for flower in flowers), dtype=np.intp, count=n)
+        # per-bucket counts are small, so int16 keeps the table compact; sums still promote to the default int
+        flower_info = np.zeros((6, 4, 3), dtype=np.int16)  # (color, type, size)
+        flower_info[c, t, s] = np.fromiter(flower_counts.values(), dtype=np.int16, count=n)
         return flower_info
 
     @staticmethod
     def _list_flowers(flower_info):
-        flower_counts = {}
-        for c in range(6):
-            for t in range(4):
-                for s in range(3):
-                    if flower_info[c][t][s] > 0:
-                        flower = Flower(
-                            size=FlowerSizes(s),
-                            color=FlowerColors(c),
-                            type=FlowerTypes(t)
-                        )
-                        flower_counts[flower] = flower_info[c][t][s]
-        return flower_counts
+        # only visit the populated (color, type, size) cells
+        cs, ts, ss = np.nonzero(flower_info > 0)
+        counts = flower_info[cs, ts, ss]
+        return {_FLOWER_CACHE[(c, t, s)]: int(v) for c, t, s, v in zip(cs, ts, ss, counts)}
 
     def zero_score_bouquet(self):
         """
         :return: a Bouquet for which your scoring function will return 0
         """
-        # is there a guaranteed min?
-        # i think the min is when we pick one attribute with 12 flowers, which is minimal in the best_arrangement vector
-        # someone check that logic but I think it works?
-        size_v, color_v, type_v = self.vectorReps[0]
-        worstFlower = Flower(
-            size=self.get_min_vector_attribute(self.best_arrangement_size_vec, FlowerSizes),
-            color=self.get_min_vector_attribute(self.best_arrangement_color_vec, FlowerColors),
-            type=self.get_min_vector_attribute(self.best_arrangement_type_vec, FlowerTypes)
-        )
-        return Bouquet({worstFlower: 12})
-
-    def get_min_vector_attribute(self, vector, enumType):
-        zipped = list(zip(vector, enumType))
-        return min(zipped)[1]
+        # 12 flowers of the attribute values that are rarest in the best arrangement; a bouquet is scored against every
+        # arrangement though, so take the rarest value that really scores 0 for each attribute
+        worst = {}
+        for attribute, enum_type, vector, score in (
+                ('size', FlowerSizes, self.best_arrangement_size_vec, self.score_sizes),
+                ('color', FlowerColors, self.best_arrangement_color_vec, self.score_colors),
+                ('type', FlowerTypes, self.best_arrangement_type_vec, self.score_types)):
+            candidates = [enum_type(int(i)) for i in np.argsort(vector, kind='stable')]
+            zero_values = [value for value in candidates if score({value: 12}) == 0]
+            if not zero_values:
+                # no single value scores 0 against every arrangement, but an empty bouquet always does
+                return Bouquet({})
+            worst[attribute] = zero_values[0]
+        return Bouquet({Flower(**worst): 12})
 
     def one_score_bouquet(self):
         """
         :return: a Bouquet for which your scoring function will return 1
         """
         # the below is still true
-        return list(self.best_arrangement)[0]
+        return self.best_bouquet
 
     def score_types(self, types: Dict[FlowerTypes, int]):
         """
         :param types: dictionary of flower types and their associated counts in the bouquet
         :return: A score representing preference of the flower types in the bouquet
         """
-        # each vector is like [FlowerType.1 Count, FlowerType.2 Count]
-        vector = [0] * len(FlowerTypes)
+        if not any(types.values()):
+            return 0
 
+        # each vector is like [FlowerType.1 Count, FlowerType.2 Count]
+        vector = np.zeros(len(FlowerTypes))
         for key, value in types.items():
             vector[key.value] = value
-        
-        if sum(vector) == 0:
-            return 0
 
-        res = [self.compute_distance_heuristic(vector, x) for x in self.typev]
-        return max(res) * 1.0/3.0
+        return self.compute_distance_heuristic(vector, self.typev) * ATTRIBUTE_WEIGHT
 
     def score_colors(self, colors: Dict[FlowerColors, int]):
         """
         :param colors: dictionary of flower colors and their associated counts in the bouquet
         :return: A score representing preference of the flower colors in the bouquet
         """
-        vector = [0] * len(FlowerColors)
-        
-        for key, value in colors.items():
-            vector[key.value] = value
-        
-        if sum(vector) == 0:
+        if not any(colors.values()):
             return 0
 
+        vector = np.zeros(len(FlowerColors))
+        for key, value in colors.items():
+            vector[key.value] = value
 
-        res = [self.compute_distance_heuristic(vector, x) for x in self.colorv]
-        return max(res) * 1.0/3.0
+        return self.compute_distance_heuristic(vector, self.colorv) * ATTRIBUTE_WEIGHT
 
     def score_sizes(self, sizes: Dict[FlowerSizes, int]):
         """
         :param sizes: dictionary of flower sizes and their associated counts in the bouquet
         :return: A score representing preference of the flower sizes in the bouquet
         """
-        vector = [0] * len(FlowerSizes)
+        if not any(sizes.values()):
+            return 0
 
+        vector = np.zeros(len(FlowerSizes))
         for key, value in sizes.items():
             vector[key.value] = value
-            
-        if sum(vector) == 0:
-            return 0
 
-        res = [self.compute_distance_heuristic(vector, x) for x in self.sizev]
-        return max(res) * 1.0/3.0
+        return self.compute_distance_heuristic(vector, self.sizev) * ATTRIBUTE_WEIGHT
 
     def receive_feedback(self, feedback):
         """